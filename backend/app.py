@@ -1,15 +1,33 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file, url_for
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timedelta
+import click
+import json
 import random
+import urllib.request
 import uuid
 import os
 
+import jobs
+import media
+
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///localstore.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///localstore.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Product image store; set USE_X_SENDFILE=1 when a front proxy (nginx,
+# Apache) should stream media files instead of the WSGI server
+app.config['MEDIA_ROOT'] = os.environ.get('MEDIA_ROOT', os.path.join(app.instance_path, 'media'))
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+
+# Directory that local image paths (e.g. offline test images) are read from;
+# local sources are refused when unset
+app.config['MEDIA_IMPORT_DIR'] = os.environ.get('MEDIA_IMPORT_DIR')
+
+# Optional endpoint notified of stock changes after each completed order
+app.config['INVENTORY_WEBHOOK_URL'] = os.environ.get('INVENTORY_WEBHOOK_URL')
+
 # Enable CORS for frontend integration
 CORS(app)
 
@@ -24,6 +42,7 @@ class Product(db.Model):
     description = db.Column(db.Text, nullable=False)
     price = db.Column(db.Float, nullable=False)
     image = db.Column(db.String(200), nullable=False)
+    image_hash = db.Column(db.String(64), nullable=True)  # Content hash in the media store
     category = db.Column(db.String(50), nullable=False)
     stock = db.Column(db.Integer, nullable=False, default=0)
     rating = db.Column(db.Float, default=0.0)
@@ -34,13 +53,15 @@ class Product(db.Model):
     reviews = db.relationship('Review', backref='product', cascade='all, delete-orphan')
     order_items = db.relationship('OrderItem', backref='product')
     
-    def to_dict(self):
+    def to_dict(self, image_size='medium'):
         return {
             'id': self.id,
             'name': self.name,
             'description': self.description,
             'price': self.price,
-            'image': self.image,
+            'image': media_url(self.image_hash, image_size) or self.image,
+            'image_source': self.image,
+            'images': media_urls(self.image_hash),
             'category': self.category,
             'stock': self.stock,
             'rating': round(self.rating, 1),
@@ -128,7 +149,7 @@ class OrderItem(db.Model):
             'id': self.id,
             'product_id': self.product_id,
             'product_name': self.product.name if self.product else None,
-            'product_image': self.product.image if self.product else None,
+            'product_image': (media_url(self.product.image_hash, 'small') or self.product.image) if self.product else None,
             'quantity': self.quantity,
             'price': self.price,
             'total': self.quantity * self.price
@@ -155,7 +176,96 @@ class Review(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    status = db.Column(db.String(20), nullable=False, default=jobs.QUEUED)  # queued, running, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=jobs.DEFAULT_MAX_ATTEMPTS)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)  # Visibility timeout of the current claim
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+queue = jobs.JobQueue(db, Job)
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    
+    version = db.Column(db.Integer, primary_key=True)  # Stamped by init-db
+
+# Background Jobs
+@queue.task('order_confirmation')
+def send_order_confirmation(order_id):
+    """Confirm a completed order to the customer"""
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return
+    # No mail provider is configured yet; outgoing email belongs here
+    app.logger.info(
+        'Order %s confirmed for %s (%d items, total %.2f)',
+        order.order_number, order.user.email, len(order.order_items), order.total_amount
+    )
+
+@queue.task('inventory_sync')
+def sync_inventory(product_ids):
+    """Push current stock levels to the inventory webhook"""
+    url = app.config['INVENTORY_WEBHOOK_URL']
+    if not url:
+        return
+    products = Product.query.filter(Product.id.in_(product_ids)).all()
+    body = json.dumps({
+        'products': [{'id': product.id, 'stock': product.stock} for product in products],
+        'timestamp': datetime.utcnow().isoformat()
+    }).encode()
+    req = urllib.request.Request(url, data=body, method='POST', headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=10) as response:
+        response.read()
+
+def enqueue_order_side_effects(order, product_ids):
+    """Queue post-order work so it commits with the order but runs off the request path"""
+    queue.enqueue('order_confirmation', {'order_id': order.id})
+    if app.config['INVENTORY_WEBHOOK_URL']:
+        queue.enqueue('inventory_sync', {'product_ids': product_ids})
+
 # Helper Functions
+def media_url(image_hash, size):
+    """Absolute URL of a stored image variant, or None if not ingested"""
+    if not image_hash:
+        return None
+    return url_for('serve_media', image_hash=image_hash, size=size, _external=True)
+
+def media_urls(image_hash):
+    """URLs for every stored variant of an image"""
+    if not image_hash:
+        return {}
+    return {size: media_url(image_hash, size) for size in media.VARIANT_SIZES}
+
+def ingest_product_image(product):
+    """Copy the product image into the media store and record its hash.
+
+    Returns the new hash, or None if the image could not be stored; failures
+    are logged and leave ``image_hash`` unchanged.
+    """
+    try:
+        image_hash = media.ingest(
+            product.image,
+            app.config['MEDIA_ROOT'],
+            import_dir=app.config['MEDIA_IMPORT_DIR']
+        )
+    except media.MediaError as e:
+        app.logger.warning('Image ingest failed for %r: %s', product.name, e)
+        return None
+    product.image_hash = image_hash
+    return image_hash
+
 def generate_order_number():
     """Generate unique order number"""
     return f"LS{datetime.now().strftime('%Y%m%d')}{random.randint(1000, 9999)}"
@@ -224,7 +334,7 @@ def get_products():
         
         return jsonify({
             'success': True,
-            'products': [product.to_dict() for product in products.items],
+            'products': [product.to_dict(image_size='small') for product in products.items],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -262,6 +372,7 @@ def create_product():
             category=data['category'],
             stock=int(data['stock'])
         )
+        ingest_product_image(product)
         
         db.session.add(product)
         db.session.commit()
@@ -286,7 +397,19 @@ def update_product(product_id):
         product.name = data.get('name', product.name)
         product.description = data.get('description', product.description)
         product.price = float(data.get('price', product.price))
-        product.image = data.get('image', product.image)
+        image = data.get('image', product.image)
+        # Admin clients echo back the served /media URL of the current image;
+        # that is not a new image, so keep the source and skip re-ingesting
+        echoed = product.image_hash and media.hash_from_url(image) == product.image_hash
+        if image != product.image and not echoed:
+            # Drop the old variants first: if the new image cannot be stored
+            # the product falls back to its source URL, like a new product,
+            # and `ingest-images` can backfill it later
+            product.image = image
+            product.image_hash = None
+            ingest_product_image(product)
+        elif not product.image_hash:
+            ingest_product_image(product)
         product.category = data.get('category', product.category)
         product.stock = int(data.get('stock', product.stock))
         
@@ -407,6 +530,10 @@ def create_order():
                 # Update product stock
                 item_data['product'].stock -= item_data['quantity']
             
+            enqueue_order_side_effects(
+                order,
+                [item_data['product'].id for item_data in order_items_data]
+            )
             db.session.commit()
             
             return jsonify({
@@ -611,6 +738,39 @@ def get_categories():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+# Media Route
+@app.route('/media/<image_hash>/<size>', methods=['GET'])
+def serve_media(image_hash, size):
+    """Serve a stored image variant; content-addressed, so cacheable forever"""
+    path = media.variant_path(app.config['MEDIA_ROOT'], image_hash, size)
+    if path is None:
+        return jsonify({'success': False, 'message': 'Image not found'}), 404
+    
+    # send_file hands the open file to the server's wsgi.file_wrapper, which
+    # uses sendfile(2) where available (or X-Sendfile when enabled above)
+    response = send_file(
+        path,
+        mimetype=media.VARIANT_MIMETYPE,
+        max_age=31536000,
+        etag=f'{image_hash}-{size}',
+        conditional=True
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# Job Queue Monitoring
+@app.route('/api/jobs/stats', methods=['GET'])
+def get_job_stats():
+    """Background job queue depth and latency"""
+    try:
+        return jsonify({
+            'success': True,
+            'jobs': queue.stats()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 # Health Check
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -633,17 +793,65 @@ def root():
             'products': '/api/products',
             'orders': '/api/orders',
             'categories': '/api/categories',
+            'job_stats': '/api/jobs/stats',
             'health_check': '/api/health'
         }
     })
 
+# Schema Management
+# Bump whenever the models change; `flask --app app init-db` brings existing
+# databases up to date and stamps this version into the schema_version table
+SCHEMA_VERSION = 2
+
+class SchemaError(RuntimeError):
+    """Raised at startup when the database schema is missing or outdated"""
+
+def get_schema_version():
+    """Version stamped by init-db, or 0 for a database it has never run on"""
+    with db.engine.connect() as conn:
+        if not db.inspect(conn).has_table(SchemaVersion.__tablename__):
+            return 0
+        return conn.execute(db.select(db.func.max(SchemaVersion.version))).scalar() or 0
+
+def check_schema():
+    """Cheap startup check: compare the stamped schema version with the models"""
+    version = get_schema_version()
+    if version != SCHEMA_VERSION:
+        raise SchemaError(
+            f'Database schema version is {version}, expected {SCHEMA_VERSION}. '
+            f'Run `flask --app app init-db` to create or upgrade it.'
+        )
+
+def warm_up():
+    """Do one-time lazy setup before serving so the first request stays fast"""
+    db.configure_mappers()
+    # Opens the first pooled connection while checking the schema
+    check_schema()
+    with app.test_request_context():
+        url_for('health_check')
+
 # Initialize Database with Sample Data
-def init_db():
-    """Initialize database with sample data"""
+def upgrade_schema():
+    """Add columns introduced after the initial schema to existing databases"""
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns('products')}
+    if 'image_hash' not in columns:
+        db.session.execute(db.text('ALTER TABLE products ADD COLUMN image_hash VARCHAR(64)'))
+        db.session.commit()
+
+def init_db(seed=True):
+    """Create or upgrade the schema and optionally add sample products"""
     db.create_all()
+    upgrade_schema()
+    if seed:
+        seed_sample_products()
     
-    # Check if products already exist
-    if Product.query.count() == 0:
+    db.session.query(SchemaVersion).delete()
+    db.session.add(SchemaVersion(version=SCHEMA_VERSION))
+    db.session.commit()
+
+def seed_sample_products():
+    """Add sample products to an empty catalogue"""
+    if db.session.query(Product.id).first() is None:
         sample_products = [
             {
                 'name': 'Premium Wireless Headphones',
@@ -714,8 +922,60 @@ def init_db():
         db.session.commit()
         print("Sample products added to database")
 
+def ingest_missing_images():
+    """Ingest every product image not yet in the media store.
+
+    Returns (stored, attempted); failures are logged per product.
+    """
+    products = Product.query.filter(Product.image_hash.is_(None)).all()
+    stored = sum(1 for product in products if ingest_product_image(product))
+    db.session.commit()
+    return stored, len(products)
+
+@app.cli.command('init-db')
+@click.option('--seed/--no-seed', default=True, show_default=True, help='Add sample products to an empty catalogue.')
+@click.option('--ingest/--no-ingest', default=True, show_default=True, help='Copy product images into the media store.')
+def init_db_command(seed, ingest):
+    """Create or upgrade the database schema"""
+    init_db(seed=seed)
+    print(f"Database ready at schema version {SCHEMA_VERSION}")
+    if ingest:
+        stored, attempted = ingest_missing_images()
+        print(f"Ingested {stored} of {attempted} product images")
+
+@app.cli.command('ingest-images')
+def ingest_images_command():
+    """Copy product images that are not yet in the media store"""
+    check_schema()
+    stored, attempted = ingest_missing_images()
+    print(f"Ingested {stored} of {attempted} product images")
+
+@app.cli.command('run-worker')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to sleep when idle.')
+@click.option('--retention-days', default=7.0, show_default=True, help='Prune finished jobs older than this while idle; 0 keeps them.')
+def run_worker_command(burst, poll_interval, retention_days):
+    """Process background jobs"""
+    warm_up()
+    retention = timedelta(days=retention_days) if retention_days > 0 else None
+    processed = queue.work(poll_interval=poll_interval, burst=burst, retention=retention)
+    print(f"Worker stopped after {processed} jobs")
+
+@app.cli.command('prune-jobs')
+@click.option('--older-than', default=7.0, show_default=True, help='Age in days of finished jobs to delete.')
+def prune_jobs_command(older_than):
+    """Delete finished jobs older than the given age"""
+    check_schema()
+    print(f"Pruned {queue.prune(timedelta(days=older_than))} finished jobs")
+
+@app.cli.command('requeue-dead-jobs')
+def requeue_dead_jobs_command():
+    """Retry every dead-lettered job from scratch"""
+    check_schema()
+    print(f"Requeued {queue.requeue_dead()} dead jobs")
+
 if __name__ == '__main__':
     with app.app_context():
-        init_db()
+        warm_up()
     
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
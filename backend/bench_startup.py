@@ -0,0 +1,79 @@
+"""Cold-start benchmark: time-to-first-200 for /api/health and /api/products.
+
+Each run starts a fresh interpreter, so module imports, engine creation,
+mapper configuration and the first queries are all paid again. Times are
+measured from just before the child process is spawned.
+
+    python bench_startup.py --runs 10
+    python bench_startup.py --no-warm   # skip warm_up() to compare
+
+The database must already be initialised (`flask --app app init-db`); set
+DATABASE_URL to benchmark a different database.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ['/api/health', '/api/products']
+PHASES = ['import', 'warm_up'] + ENDPOINTS
+
+
+def child(warm):
+    """Runs inside the spawned process and prints absolute timestamps"""
+    marks = {}
+    from app import app, warm_up
+    marks['import'] = time.time()
+
+    with app.app_context():
+        if warm:
+            warm_up()
+    marks['warm_up'] = time.time()
+
+    client = app.test_client()
+    for endpoint in ENDPOINTS:
+        response = client.get(endpoint)
+        if response.status_code != 200:
+            raise SystemExit(f'{endpoint} returned {response.status_code}: {response.get_data(as_text=True)[:200]}')
+        marks[endpoint] = time.time()
+
+    print(json.dumps(marks))
+
+
+def run_once(warm):
+    command = [sys.executable, os.path.abspath(__file__), '--child']
+    if not warm:
+        command.append('--no-warm')
+    started = time.time()
+    result = subprocess.run(command, cwd=HERE, capture_output=True, text=True, check=True)
+    marks = json.loads(result.stdout.strip().splitlines()[-1])
+    return {phase: (marks[phase] - started) * 1000 for phase in PHASES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--no-warm', dest='warm', action='store_false', help='Skip warm_up() before the first request')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.warm)
+        return
+
+    samples = [run_once(args.warm) for _ in range(args.runs)]
+
+    print(f"Cold start over {args.runs} runs ({'with' if args.warm else 'without'} warm_up), ms since spawn")
+    print(f"{'phase':<20}{'median':>10}{'min':>10}{'max':>10}")
+    for phase in PHASES:
+        values = [sample[phase] for sample in samples]
+        label = f'200 {phase}' if phase in ENDPOINTS else phase
+        print(f"{label:<20}{statistics.median(values):>10.1f}{min(values):>10.1f}{max(values):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""Durable background job queue stored in the application database.
+
+Jobs are rows in the ``jobs`` table, so enqueueing inside a request commits
+atomically with the data it refers to and no external broker is needed.
+Workers claim one job at a time with a conditional UPDATE, which keeps
+several worker processes from running the same job. A claimed job is
+invisible to other workers until its visibility timeout expires; if the
+worker dies the job becomes claimable again. Failed jobs are retried with
+exponential backoff and moved to the ``dead`` status once they run out of
+attempts.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import SQLAlchemyError
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+DEAD = 'dead'
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_VISIBILITY_TIMEOUT = 300  # seconds a claimed job stays hidden
+BACKOFF_BASE = 10  # seconds before the first retry
+BACKOFF_MAX = 3600
+DEFAULT_RETENTION = timedelta(days=7)  # how long finished jobs are kept
+PRUNE_INTERVAL = 3600  # seconds between prunes in an idle worker
+
+logger = logging.getLogger(__name__)
+
+# The claim a worker holds on a job, captured when it starts running it
+Lease = namedtuple('Lease', 'id locked_by started_at attempts max_attempts')
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before retrying a job that has failed ``attempts`` times"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    # Jitter so jobs that failed together do not all retry together
+    return delay * random.uniform(0.8, 1.2)
+
+
+class JobQueue:
+    """Enqueue, claim and settle jobs backed by a SQLAlchemy model"""
+
+    def __init__(self, db, model, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        self.db = db
+        self.model = model
+        self.visibility_timeout = visibility_timeout
+        self.handlers = {}
+
+    def task(self, name):
+        """Register the decorated function as the handler for ``name`` jobs"""
+        def decorator(func):
+            self.handlers[name] = func
+            return func
+        return decorator
+
+    def enqueue(self, name, payload=None, delay=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Add a job to the current session; it becomes visible on commit"""
+        if name not in self.handlers:
+            raise ValueError(f'No handler registered for job {name!r}')
+        now = datetime.utcnow()
+        job = self.model(
+            name=name,
+            payload=json.dumps(payload or {}),
+            status=QUEUED,
+            max_attempts=max_attempts,
+            run_at=now + timedelta(seconds=delay),
+            created_at=now
+        )
+        self.db.session.add(job)
+        return job
+
+    def claim(self, worker_id):
+        """Lease the next runnable job to ``worker_id``, or return None.
+
+        Every path ends its transaction: an idle worker polling an empty
+        queue must not keep SQLite's write lock between polls.
+        """
+        Job = self.model
+        session = self.db.session
+        now = datetime.utcnow()
+        expired = self.db.and_(Job.status == RUNNING, Job.locked_until < now)
+
+        try:
+            # A job whose lease expired on its last attempt most likely crashed
+            # its worker; dead-letter it rather than handing it out again.
+            # Look before writing so idle polls never take the write lock.
+            final_expired = self.db.and_(expired, Job.attempts >= Job.max_attempts)
+            if session.query(Job.id).filter(final_expired).first() is not None:
+                session.query(Job).filter(final_expired).update({
+                    Job.status: DEAD,
+                    Job.last_error: 'Visibility timeout expired on final attempt',
+                    Job.locked_by: None,
+                    Job.locked_until: None,
+                    Job.finished_at: now
+                }, synchronize_session=False)
+                session.commit()
+
+            runnable = self.db.or_(
+                self.db.and_(Job.status == QUEUED, Job.run_at <= now),
+                self.db.and_(expired, Job.attempts < Job.max_attempts)
+            )
+
+            for _ in range(5):
+                candidate = session.query(Job.id).filter(runnable)\
+                    .order_by(Job.run_at.asc(), Job.id.asc()).first()
+                if candidate is None:
+                    break
+
+                # Only one worker can win the conditional update for a given row
+                claimed = session.query(Job).filter(Job.id == candidate.id, runnable).update({
+                    Job.status: RUNNING,
+                    Job.attempts: Job.attempts + 1,
+                    Job.locked_by: worker_id,
+                    Job.locked_until: now + timedelta(seconds=self.visibility_timeout),
+                    Job.started_at: now
+                }, synchronize_session=False)
+                session.commit()
+
+                if claimed:
+                    return session.get(Job, candidate.id)
+        except Exception:
+            session.rollback()
+            raise
+
+        session.rollback()
+        return None
+
+    def _settle(self, job, values):
+        """Apply ``values`` only while ``job`` (a Job or Lease) still holds the
+        lease it was claimed with; returns False if it was re-claimed since"""
+        Job = self.model
+        settled = self.db.session.query(Job).filter(
+            Job.id == job.id,
+            Job.status == RUNNING,
+            Job.locked_by == job.locked_by,
+            Job.started_at == job.started_at
+        ).update(dict(values, locked_by=None, locked_until=None), synchronize_session=False)
+        self.db.session.commit()
+        return bool(settled)
+
+    def complete(self, job):
+        return self._settle(job, {
+            'status': DONE,
+            'finished_at': datetime.utcnow(),
+            'last_error': None
+        })
+
+    def fail(self, job, error):
+        """Schedule a retry with backoff, or dead-letter the job"""
+        if job.attempts >= job.max_attempts:
+            values = {'status': DEAD, 'finished_at': datetime.utcnow()}
+        else:
+            values = {
+                'status': QUEUED,
+                'run_at': datetime.utcnow() + timedelta(seconds=backoff_delay(job.attempts))
+            }
+        values['last_error'] = error[-2000:]
+        return self._settle(job, values)
+
+    def run_job(self, job):
+        """Run a claimed job and record the outcome; returns True on success.
+
+        The outcome is dropped if the lease expired mid-run and another
+        worker has claimed the job since.
+        """
+        # Snapshot the lease: the handler may commit or roll back the shared
+        # session, which would otherwise reload these from the current row
+        lease = Lease(job.id, job.locked_by, job.started_at, job.attempts, job.max_attempts)
+        handler = self.handlers.get(job.name)
+        try:
+            if handler is None:
+                raise LookupError(f'No handler registered for job {job.name!r}')
+            handler(**json.loads(job.payload))
+        except Exception:
+            error = traceback.format_exc()
+            self.db.session.rollback()
+            self.fail(lease, error)
+            return False
+
+        return self.complete(lease)
+
+    def run_once(self, worker_id=None):
+        """Claim and run a single job; returns False when the queue is empty"""
+        job = self.claim(worker_id or default_worker_id())
+        if job is None:
+            return False
+        self.run_job(job)
+        return True
+
+    def work(self, poll_interval=1.0, burst=False, worker_id=None, retention=DEFAULT_RETENTION):
+        """Process jobs until interrupted (or until empty when ``burst``).
+
+        While idle the worker also prunes jobs finished longer than
+        ``retention`` ago, at most once per PRUNE_INTERVAL; pass None to keep
+        them. Database errors (e.g. SQLite reporting the database as locked
+        while a checkout commits) are logged and retried after
+        ``poll_interval`` rather than stopping the worker; a job caught
+        mid-settle is picked up again once its lease expires.
+        """
+        worker_id = worker_id or default_worker_id()
+        processed = 0
+        last_prune = None
+        try:
+            while True:
+                try:
+                    if self.run_once(worker_id):
+                        processed += 1
+                        continue
+                    if retention is not None and (last_prune is None or time.monotonic() - last_prune >= PRUNE_INTERVAL):
+                        self.prune(retention)
+                        last_prune = time.monotonic()
+                except SQLAlchemyError:
+                    logger.exception('Job worker %s hit a database error; retrying', worker_id)
+                    self.db.session.rollback()
+                    time.sleep(poll_interval)
+                    continue
+                if burst:
+                    break
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        return processed
+
+    def requeue_dead(self):
+        """Give every dead-lettered job a fresh set of attempts"""
+        Job = self.model
+        count = Job.query.filter(Job.status == DEAD).update({
+            Job.status: QUEUED,
+            Job.attempts: 0,
+            Job.run_at: datetime.utcnow(),
+            Job.finished_at: None
+        }, synchronize_session=False)
+        self.db.session.commit()
+        return count
+
+    def prune(self, older_than=DEFAULT_RETENTION):
+        """Delete jobs that finished successfully more than ``older_than`` ago.
+
+        Dead jobs are kept so failures stay inspectable until requeued.
+        """
+        Job = self.model
+        count = Job.query.filter(
+            Job.status == DONE,
+            Job.finished_at < datetime.utcnow() - older_than
+        ).delete(synchronize_session=False)
+        self.db.session.commit()
+        return count
+
+    def stats(self, window=200):
+        """Queue depth per status and latency over the most recent jobs"""
+        Job = self.model
+        now = datetime.utcnow()
+        counts = dict(
+            self.db.session.query(Job.status, self.db.func.count(Job.id))
+            .group_by(Job.status).all()
+        )
+        oldest = self.db.session.query(self.db.func.min(Job.run_at))\
+            .filter(Job.status == QUEUED, Job.run_at <= now).scalar()
+        due = Job.query.filter(Job.status == QUEUED, Job.run_at <= now).count()
+
+        recent = Job.query.filter(Job.status == DONE)\
+            .order_by(Job.finished_at.desc()).limit(window).all()
+        # Wait is measured from when the job became runnable to when it was
+        # last claimed, run time from that claim to completion
+        waits = [(job.started_at - job.run_at).total_seconds() for job in recent]
+        runs = [(job.finished_at - job.started_at).total_seconds() for job in recent]
+
+        return {
+            'depth': {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, DEAD)},
+            'due': due,
+            'oldest_due_age_seconds': round((now - oldest).total_seconds(), 3) if oldest else 0,
+            'latency': {
+                'sample_size': len(recent),
+                'wait_avg_seconds': _average(waits),
+                'wait_max_seconds': round(max(waits), 3) if waits else None,
+                'run_avg_seconds': _average(runs),
+                'run_max_seconds': round(max(runs), 3) if runs else None
+            }
+        }
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _average(values):
+    return round(sum(values) / len(values), 3) if values else None
@@ -0,0 +1,241 @@
+"""Content-addressed media store for product images.
+
+Source images (public URLs or files under an import directory) are read
+once, hashed with SHA-256 and re-encoded into a fixed set of JPEG variants
+under ``<media_root>/<hash>/<size>.jpg``. Because the path is derived from the
+content, a stored variant never changes and can be cached forever.
+"""
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import re
+import shutil
+import socket
+import tempfile
+import urllib.request
+from urllib.parse import urlparse, unquote
+
+# Pillow is imported where images are decoded; it is only needed when
+# ingesting, and keeping it off the import path shortens cold starts
+
+# Longest edge in pixels for each generated variant
+VARIANT_SIZES = {
+    'thumb': 96,
+    'small': 320,
+    'medium': 640,
+    'large': 1280
+}
+
+VARIANT_EXTENSION = 'jpg'
+VARIANT_MIMETYPE = 'image/jpeg'
+JPEG_QUALITY = 85
+
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+FETCH_TIMEOUT = 10
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+MEDIA_PATH_PATTERN = re.compile(r'/media/([0-9a-f]{64})/[a-z]+/?$')
+
+
+class MediaError(Exception):
+    """Raised when a source image cannot be read or decoded"""
+
+
+def public_address(host, port):
+    """Resolve ``host`` and return an address to connect to, refusing hosts
+    with any private, loopback, link-local or reserved address"""
+    if not host:
+        raise MediaError('Image URL has no host')
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except OSError as e:
+        raise MediaError(f'Could not resolve image host {host}: {e}') from e
+    for info in infos:
+        ip = ipaddress.ip_address(info[4][0].split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            raise MediaError(f'Image host {host} resolves to non-public address {ip}')
+    return infos[0][4][0]
+
+
+def _create_public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    # Connect to the address that passed the check instead of letting the
+    # socket layer resolve the name again, which a rebinding DNS server
+    # could answer with an internal address
+    host, port = address
+    return socket.create_connection((public_address(host, port), port), timeout, source_address)
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_public_connection
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    # The TLS layer still uses self.host, so SNI, certificate checks and the
+    # Host header all keep the original name
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_public_connection
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Only follow redirects to http(s); the target host is checked when the
+    pinned connection is made"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urlparse(newurl).scheme not in ('http', 'https'):
+            raise MediaError(f'Refusing redirect to {newurl}')
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# No proxies: a proxy would make the connection checks apply to the proxy
+# rather than to the image host
+_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}),
+    _PublicHTTPHandler,
+    _PublicHTTPSHandler,
+    _CheckedRedirectHandler
+)
+
+
+def _import_path(path, import_dir):
+    """Resolve a local source inside ``import_dir``, refusing anything outside it"""
+    if not import_dir:
+        raise MediaError('Local image sources are disabled; set MEDIA_IMPORT_DIR to allow them')
+    root = os.path.realpath(import_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise MediaError(f'Image path {path} is outside the import directory')
+    return resolved
+
+
+def read_source(source, import_dir=None):
+    """Read raw image bytes from a public http(s) URL or a file under ``import_dir``.
+
+    Relative paths and ``file://`` URLs are resolved inside ``import_dir``;
+    local sources are refused when it is not set.
+    """
+    parsed = urlparse(source)
+
+    if parsed.scheme in ('http', 'https'):
+        req = urllib.request.Request(source, headers={'User-Agent': 'LocalStore-Media/1.0'})
+        try:
+            with _opener.open(req, timeout=FETCH_TIMEOUT) as response:
+                data = response.read(MAX_SOURCE_BYTES + 1)
+        except OSError as e:
+            raise MediaError(f'Could not fetch image {source}: {e}') from e
+    else:
+        if parsed.scheme == 'file':
+            path = unquote(parsed.path)
+        elif parsed.scheme and len(parsed.scheme) > 1:
+            raise MediaError(f'Unsupported image source: {source}')
+        else:
+            path = source
+        path = _import_path(path, import_dir)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read(MAX_SOURCE_BYTES + 1)
+        except OSError as e:
+            raise MediaError(f'Could not read image {source}: {e}') from e
+
+    if len(data) > MAX_SOURCE_BYTES:
+        raise MediaError(f'Image {source} exceeds {MAX_SOURCE_BYTES} bytes')
+    return data
+
+
+def _encode_variant(image, edge):
+    from PIL import Image
+
+    variant = image.copy()
+    variant.thumbnail((edge, edge), Image.LANCZOS)
+    buffer = io.BytesIO()
+    variant.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _to_rgb(image):
+    """Flatten transparency onto white so the image can be stored as JPEG"""
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def store_bytes(data, media_root):
+    """Store image bytes and their variants, returning the content hash"""
+    from PIL import Image, UnidentifiedImageError
+
+    digest = hashlib.sha256(data).hexdigest()
+    target = os.path.join(media_root, digest)
+    if os.path.isdir(target):
+        return digest
+
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            image = _to_rgb(source)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise MediaError(f'Unsupported or corrupt image: {e}') from e
+
+    # Build every variant in a scratch directory and move it into place in a
+    # single rename so readers never see a partially written hash directory.
+    os.makedirs(media_root, exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix='.ingest-', dir=media_root)
+    try:
+        for size, edge in VARIANT_SIZES.items():
+            with open(os.path.join(scratch, f'{size}.{VARIANT_EXTENSION}'), 'wb') as f:
+                f.write(_encode_variant(image, edge))
+        try:
+            os.rename(scratch, target)
+        except OSError:
+            # Another worker stored the same content first
+            if not os.path.isdir(target):
+                raise
+    finally:
+        if os.path.isdir(scratch):
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    return digest
+
+
+def ingest(source, media_root, import_dir=None):
+    """Ingest an image source into the store, returning its content hash.
+
+    Sources that already point at this store (``/media/<hash>/<size>``) are
+    resolved to their existing hash without re-reading anything.
+    """
+    digest = hash_from_url(source)
+    if digest and os.path.isdir(os.path.join(media_root, digest)):
+        return digest
+    return store_bytes(read_source(source, import_dir), media_root)
+
+
+def hash_from_url(url):
+    """Return the content hash embedded in a /media URL, if any"""
+    match = MEDIA_PATH_PATTERN.search(urlparse(url or '').path)
+    return match.group(1) if match else None
+
+
+def variant_path(media_root, digest, size):
+    """Resolve the file for a stored variant, or None if it does not exist"""
+    if not HASH_PATTERN.match(digest) or size not in VARIANT_SIZES:
+        return None
+    path = os.path.join(media_root, digest, f'{size}.{VARIANT_EXTENSION}')
+    return path if os.path.isfile(path) else None
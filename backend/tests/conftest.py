@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# app.py reads its configuration at import time, so point it at scratch
+# locations before the first import
+_scratch = tempfile.mkdtemp(prefix='localstore-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_scratch, 'test.db')
+os.environ['MEDIA_ROOT'] = os.path.join(_scratch, 'media')
+os.environ.pop('MEDIA_IMPORT_DIR', None)
+os.environ.pop('INVENTORY_WEBHOOK_URL', None)
+
+import app as localstore  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App with an empty, freshly created database and media store"""
+    import_dir = tmp_path / 'import'
+    import_dir.mkdir()
+    localstore.app.config.update(
+        TESTING=True,
+        MEDIA_ROOT=str(tmp_path / 'media'),
+        MEDIA_IMPORT_DIR=str(import_dir),
+        INVENTORY_WEBHOOK_URL=None
+    )
+    with localstore.app.app_context():
+        localstore.db.drop_all()
+        localstore.init_db(seed=False)
+        yield localstore.app
+        localstore.db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_image(app):
+    """Write a generated image into the import directory and return its name"""
+    from PIL import Image
+
+    def _make(name='sample.png', size=(1600, 1200), color=(200, 40, 40, 255)):
+        Image.new('RGBA', size, color).save(os.path.join(app.config['MEDIA_IMPORT_DIR'], name))
+        return name
+    return _make
+
+
+@pytest.fixture
+def product_data():
+    def _data(**overrides):
+        data = {
+            'name': 'Test Lamp',
+            'description': 'A lamp used in tests.',
+            'price': 1500,
+            'image': 'sample.png',
+            'category': 'Home',
+            'stock': 10
+        }
+        data.update(overrides)
+        return data
+    return _data
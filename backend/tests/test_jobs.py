@@ -0,0 +1,298 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import app as localstore
+import jobs
+from app import Job, Product, db, queue
+
+
+@pytest.fixture
+def product(app):
+    product = Product(
+        name='Test Kettle',
+        description='A kettle used in tests.',
+        price=2500.0,
+        image='kettle.png',
+        category='Home',
+        stock=5
+    )
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+@pytest.fixture
+def payment(monkeypatch):
+    """Make simulate_payment deterministic; call with success=False to fail"""
+    def _payment(success=True):
+        monkeypatch.setattr(localstore, 'simulate_payment', lambda method, phone, amount: {
+            'success': success,
+            'transaction_id': 'TEST123' if success else None,
+            'message': 'ok' if success else 'declined'
+        })
+    _payment()
+    return _payment
+
+
+@pytest.fixture
+def task(monkeypatch):
+    """Register a handler on the shared queue for the duration of a test"""
+    def _task(name, func):
+        monkeypatch.setitem(queue.handlers, name, func)
+        return func
+    return _task
+
+
+def order_body(product_id, quantity=1):
+    return {
+        'customer': {'firstName': 'Ali', 'lastName': 'Khan', 'email': 'ali@example.com', 'phone': '0300-1234567'},
+        'items': [{'id': product_id, 'quantity': quantity}],
+        'payment': {'method': 'jazzcash', 'phoneNumber': '0300-1234567'},
+        'shipping': {'address': '1 Mall Road', 'city': 'Lahore', 'postalCode': '54000', 'country': 'Pakistan'}
+    }
+
+
+def job_names():
+    return sorted(name for (name,) in db.session.query(Job.name).all())
+
+
+def test_completed_order_enqueues_side_effects(client, product, payment):
+    response = client.post('/api/orders', json=order_body(product.id))
+
+    assert response.status_code == 201
+    assert job_names() == ['order_confirmation']
+
+
+def test_inventory_sync_is_enqueued_when_webhook_configured(app, client, product, payment):
+    app.config['INVENTORY_WEBHOOK_URL'] = 'https://inventory.example.com/hook'
+
+    client.post('/api/orders', json=order_body(product.id))
+
+    assert job_names() == ['inventory_sync', 'order_confirmation']
+
+
+def test_failed_payment_enqueues_nothing(client, product, payment):
+    payment(success=False)
+
+    response = client.post('/api/orders', json=order_body(product.id))
+
+    assert response.status_code == 400
+    assert job_names() == []
+
+
+def test_rejected_order_enqueues_nothing(client, product, payment):
+    response = client.post('/api/orders', json=order_body(product.id, quantity=50))
+
+    assert response.status_code == 400
+    assert job_names() == []
+
+
+def test_worker_runs_order_confirmation(client, product, payment):
+    client.post('/api/orders', json=order_body(product.id))
+
+    assert queue.work(burst=True) == 1
+    assert db.session.query(Job.status).scalar() == jobs.DONE
+
+
+def test_failing_job_retries_with_backoff_then_dead_letters(app, task):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        raise RuntimeError('webhook down')
+    task('flaky', flaky)
+    job = queue.enqueue('flaky', max_attempts=2)
+    db.session.commit()
+
+    assert queue.run_once('worker-1')
+    job = db.session.get(Job, job.id)
+    delay = (job.run_at - datetime.utcnow()).total_seconds()
+    assert job.status == jobs.QUEUED
+    assert job.attempts == 1
+    assert jobs.BACKOFF_BASE * 0.7 < delay < jobs.BACKOFF_BASE * 1.3
+    assert 'webhook down' in job.last_error
+
+    # Not runnable again until the backoff has elapsed
+    assert not queue.run_once('worker-1')
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+
+    assert queue.run_once('worker-1')
+    job = db.session.get(Job, job.id)
+    assert job.status == jobs.DEAD
+    assert job.attempts == 2
+    assert len(calls) == 2
+
+
+def test_backoff_grows_and_is_capped():
+    assert jobs.backoff_delay(3) > jobs.backoff_delay(1) * 2
+    assert jobs.backoff_delay(50) <= jobs.BACKOFF_MAX * 1.2
+
+
+def test_expired_lease_is_reclaimed(app, task):
+    task('noop', lambda: None)
+    job = queue.enqueue('noop')
+    db.session.commit()
+
+    first = queue.claim('worker-1')
+    stale = jobs.Lease(first.id, first.locked_by, first.started_at, first.attempts, first.max_attempts)
+    assert queue.claim('worker-2') is None
+
+    first.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    second = queue.claim('worker-2')
+
+    assert second.id == job.id
+    assert second.locked_by == 'worker-2'
+    assert second.attempts == 2
+    # The original worker finishing late must not clobber the new claim
+    assert not queue.complete(stale)
+    assert db.session.get(Job, job.id).locked_by == 'worker-2'
+
+
+def test_lease_lost_during_run_is_not_overwritten(app, task):
+    def slow():
+        # Another worker re-claims the job after our lease expired; it does
+        # so on its own connection, leaving this session's cached row as is
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            conn.execute(db.update(Job).values(
+                locked_by='worker-2',
+                started_at=now,
+                locked_until=now + timedelta(seconds=60),
+                attempts=Job.attempts + 1
+            ))
+    task('slow', slow)
+    queue.enqueue('slow')
+    db.session.commit()
+
+    assert queue.run_once('worker-1')
+
+    db.session.expire_all()
+    job = db.session.query(Job).one()
+    assert job.status == jobs.RUNNING
+    assert job.locked_by == 'worker-2'
+
+
+def test_expired_lease_on_final_attempt_is_dead_lettered(app, task):
+    task('noop', lambda: None)
+    job = queue.enqueue('noop', max_attempts=1)
+    db.session.commit()
+    claimed = queue.claim('worker-1')
+    claimed.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert queue.claim('worker-2') is None
+    assert db.session.get(Job, job.id).status == jobs.DEAD
+
+
+def test_requeue_dead(app, task):
+    task('broken', lambda: 1 / 0)
+    job = queue.enqueue('broken', max_attempts=1)
+    db.session.commit()
+    queue.run_once()
+    assert db.session.get(Job, job.id).status == jobs.DEAD
+
+    assert queue.requeue_dead() == 1
+
+    job = db.session.get(Job, job.id)
+    assert job.status == jobs.QUEUED
+    assert job.attempts == 0
+
+
+def test_prune_deletes_only_old_finished_jobs(app):
+    old = datetime.utcnow() - timedelta(days=30)
+    db.session.add_all([
+        Job(name='old-done', status=jobs.DONE, run_at=old, finished_at=old),
+        Job(name='old-dead', status=jobs.DEAD, run_at=old, finished_at=old),
+        Job(name='new-done', status=jobs.DONE, run_at=old, finished_at=datetime.utcnow())
+    ])
+    db.session.commit()
+
+    assert queue.prune(timedelta(days=7)) == 1
+    assert job_names() == ['new-done', 'old-dead']
+
+
+def test_job_stats_endpoint(client, task):
+    task('noop', lambda: None)
+    queue.enqueue('noop')
+    queue.enqueue('noop')
+    db.session.commit()
+    queue.run_once()
+
+    response = client.get('/api/jobs/stats')
+
+    stats = response.get_json()['jobs']
+    assert response.status_code == 200
+    assert stats['depth'] == {'queued': 1, 'running': 0, 'done': 1, 'dead': 0}
+    assert stats['due'] == 1
+    assert stats['latency']['sample_size'] == 1
+    assert stats['latency']['run_avg_seconds'] >= 0
+
+
+def test_idle_worker_does_not_block_checkout(app, client, product, payment):
+    stop = threading.Event()
+    errors = []
+
+    def idle_worker():
+        try:
+            with app.app_context():
+                while not stop.is_set():
+                    queue.run_once('idle-worker')
+                    time.sleep(0.01)
+        except Exception as e:
+            errors.append(e)
+
+    worker = threading.Thread(target=idle_worker)
+    worker.start()
+    try:
+        time.sleep(0.1)
+        started = time.monotonic()
+        response = client.post('/api/orders', json=order_body(product.id))
+        elapsed = time.monotonic() - started
+    finally:
+        stop.set()
+        worker.join()
+
+    assert response.status_code == 201, response.get_json()
+    assert elapsed < 2
+    assert errors == []
+
+
+def test_worker_survives_database_errors(app, task, monkeypatch):
+    task('noop', lambda: None)
+    queue.enqueue('noop')
+    db.session.commit()
+
+    real_claim = queue.claim
+    failures = []
+
+    def flaky_claim(worker_id):
+        if not failures:
+            failures.append(worker_id)
+            raise OperationalError('UPDATE jobs', {}, Exception('database is locked'))
+        return real_claim(worker_id)
+    monkeypatch.setattr(queue, 'claim', flaky_claim)
+
+    assert queue.work(poll_interval=0, burst=True) == 1
+    assert failures
+    assert db.session.query(Job.status).scalar() == jobs.DONE
+
+
+def test_idle_claim_issues_no_writes(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper())
+    db.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert queue.claim('idle-worker') is None
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert statements
+    assert set(statements) == {'SELECT'}
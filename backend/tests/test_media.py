@@ -0,0 +1,178 @@
+import os
+import socket
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import media
+
+
+def local_path(url):
+    return url.replace('http://localhost', '')
+
+
+def test_ingest_local_image_creates_every_variant(app, make_image):
+    name = make_image(size=(1600, 1200))
+
+    digest = media.ingest(name, app.config['MEDIA_ROOT'], import_dir=app.config['MEDIA_IMPORT_DIR'])
+
+    assert media.HASH_PATTERN.match(digest)
+    for size, edge in media.VARIANT_SIZES.items():
+        path = media.variant_path(app.config['MEDIA_ROOT'], digest, size)
+        with Image.open(path) as image:
+            assert image.format == 'JPEG'
+            assert image.size == (edge, edge * 3 // 4)
+
+
+def test_ingest_is_content_addressed(app, make_image):
+    first = media.ingest(make_image('a.png'), app.config['MEDIA_ROOT'], import_dir=app.config['MEDIA_IMPORT_DIR'])
+    second = media.ingest(make_image('b.png'), app.config['MEDIA_ROOT'], import_dir=app.config['MEDIA_IMPORT_DIR'])
+    assert first == second
+    assert media.ingest(f'http://example.com/media/{first}/small', app.config['MEDIA_ROOT']) == first
+
+
+@pytest.mark.parametrize('source', ['{outside}', 'file://{outside}', '../outside.png'])
+def test_local_sources_are_confined_to_import_dir(app, tmp_path, source):
+    outside = tmp_path / 'outside.png'
+    Image.new('RGB', (10, 10)).save(outside)
+
+    with pytest.raises(media.MediaError):
+        media.read_source(source.format(outside=outside), app.config['MEDIA_IMPORT_DIR'])
+
+
+def test_local_sources_need_an_import_dir(make_image):
+    name = make_image()
+    with pytest.raises(media.MediaError, match='MEDIA_IMPORT_DIR'):
+        media.read_source(name, None)
+
+
+@pytest.mark.parametrize('url', [
+    'http://127.0.0.1/a.png',
+    'http://localhost/a.png',
+    'http://169.254.169.254/latest',
+    'http://10.0.0.1/a.png'
+])
+def test_private_hosts_are_refused(url):
+    with pytest.raises(media.MediaError, match='non-public'):
+        media.read_source(url)
+
+
+def test_create_product_ingests_image(client, make_image, product_data):
+    make_image()
+    response = client.post('/api/products', json=product_data())
+
+    assert response.status_code == 201
+    product = response.get_json()['product']
+    assert product['image_source'] == 'sample.png'
+    assert product['image'].endswith('/medium')
+    assert set(product['images']) == set(media.VARIANT_SIZES)
+
+
+def test_failed_ingest_falls_back_to_source(client, product_data):
+    response = client.post('/api/products', json=product_data(image='missing.png'))
+
+    product = response.get_json()['product']
+    assert response.status_code == 201
+    assert product['image'] == 'missing.png'
+    assert product['images'] == {}
+
+
+def test_product_list_returns_small_variant(client, make_image, product_data):
+    make_image()
+    client.post('/api/products', json=product_data())
+
+    product = client.get('/api/products').get_json()['products'][0]
+    assert product['image'].endswith('/small')
+
+
+def test_media_route_serves_variant_with_immutable_caching(client, make_image, product_data):
+    make_image()
+    product = client.post('/api/products', json=product_data()).get_json()['product']
+    url = local_path(product['images']['thumb'])
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+    assert Image.open(BytesIO(response.data)).size == (96, 72)
+
+    cached = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+
+def test_media_route_unknown_variant_is_404(client, make_image, product_data):
+    make_image()
+    product = client.post('/api/products', json=product_data()).get_json()['product']
+    digest = media.hash_from_url(product['image'])
+
+    assert client.get(f'/media/{"0" * 64}/small').status_code == 404
+    assert client.get(f'/media/{digest}/huge').status_code == 404
+    assert client.get('/media/not-a-hash/small').status_code == 404
+
+
+def test_update_echoing_media_url_keeps_variants(app, client, make_image, product_data):
+    make_image()
+    product = client.post('/api/products', json=product_data()).get_json()['product']
+    # Without the source, any attempt to re-ingest it would fail
+    os.remove(os.path.join(app.config['MEDIA_IMPORT_DIR'], 'sample.png'))
+
+    response = client.put(f"/api/products/{product['id']}", json={'image': product['image'], 'name': 'Renamed'})
+
+    updated = response.get_json()['product']
+    assert response.status_code == 200
+    assert updated['name'] == 'Renamed'
+    assert updated['image_source'] == 'sample.png'
+    assert updated['images'] == product['images']
+
+
+def test_update_with_unreachable_image_falls_back_to_source(app, client, make_image, product_data):
+    make_image()
+    product = client.post('/api/products', json=product_data()).get_json()['product']
+
+    updated = client.put(f"/api/products/{product['id']}", json={'image': 'gone.png'}).get_json()['product']
+
+    assert updated['image_source'] == 'gone.png'
+    assert updated['image'] == 'gone.png'
+    assert updated['images'] == {}
+
+    # Once the source is reachable the backfill picks the product up again
+    make_image('gone.png', color=(0, 90, 200, 255))
+    result = app.test_cli_runner().invoke(args=['ingest-images'])
+    assert 'Ingested 1 of 1 product images' in result.output
+    repaired = client.get(f"/api/products/{product['id']}").get_json()['product']
+    assert repaired['image'].endswith('/medium')
+    assert repaired['images'] != product['images']
+
+
+def test_fetch_connects_to_the_checked_address(monkeypatch):
+    """A rebinding DNS server cannot swap in an internal address after the
+    check: the socket connects to the address that was checked"""
+    answers = iter(['93.184.216.34', '127.0.0.1'])
+    lookups, connections = [], []
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        lookups.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (next(answers), port))]
+
+    def create_connection(address, *args, **kwargs):
+        connections.append(address)
+        raise ConnectionRefusedError('test stops here')
+
+    monkeypatch.setattr(media.socket, 'getaddrinfo', getaddrinfo)
+    monkeypatch.setattr(media.socket, 'create_connection', create_connection)
+
+    with pytest.raises(media.MediaError, match='Could not fetch'):
+        media.read_source('http://rebind.example.com/a.png')
+
+    assert lookups == ['rebind.example.com']
+    assert connections == [('93.184.216.34', 80)]
+
+
+def test_https_host_resolving_to_private_address_is_refused(monkeypatch):
+    monkeypatch.setattr(media.socket, 'getaddrinfo', lambda host, port, *a, **kw: [
+        (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('169.254.169.254', port))
+    ])
+    with pytest.raises(media.MediaError, match='non-public'):
+        media.read_source('https://metadata.example.com/latest')
@@ -0,0 +1,53 @@
+import pytest
+
+from app import SCHEMA_VERSION, Product, SchemaError, SchemaVersion, check_schema, db, get_schema_version, warm_up
+
+
+def test_initialised_database_passes_check(app):
+    assert get_schema_version() == SCHEMA_VERSION
+    check_schema()
+    warm_up()
+
+
+def test_database_without_version_table_is_rejected(app):
+    SchemaVersion.__table__.drop(db.engine)
+
+    assert get_schema_version() == 0
+    with pytest.raises(SchemaError, match='init-db'):
+        check_schema()
+
+
+def test_outdated_database_is_rejected(app):
+    db.session.query(SchemaVersion).update({'version': SCHEMA_VERSION - 1})
+    db.session.commit()
+
+    with pytest.raises(SchemaError, match=f'expected {SCHEMA_VERSION}'):
+        check_schema()
+
+
+def test_health_and_products_respond_after_warm_up(app, client):
+    warm_up()
+
+    assert client.get('/api/health').status_code == 200
+    assert client.get('/api/products').status_code == 200
+
+
+def test_init_db_command_ingests_product_images(app, make_image, product_data):
+    db.session.add(Product(**product_data(image=make_image())))
+    db.session.add(Product(**product_data(name='Broken', image='missing.png')))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['init-db', '--no-seed'])
+
+    assert result.exit_code == 0, result.output
+    assert 'Ingested 1 of 2 product images' in result.output
+    assert db.session.query(Product.image_hash).filter(Product.name == 'Test Lamp').scalar()
+
+
+def test_requeue_dead_jobs_checks_schema(app):
+    SchemaVersion.__table__.drop(db.engine)
+
+    result = app.test_cli_runner().invoke(args=['requeue-dead-jobs'])
+
+    assert result.exit_code != 0
+    assert isinstance(result.exception, SchemaError)
@@ -0,0 +1,10 @@
+"""Production entry point, e.g. ``gunicorn wsgi:app``.
+
+Each worker checks the schema version and warms the engine and mappers on
+import, so a worker with an outdated database fails to boot instead of
+failing requests, and the first request does not pay for lazy setup.
+"""
+from app import app, warm_up
+
+with app.app_context():
+    warm_up()